@@ -1,13 +1,27 @@
+import asyncio
+import os
 import pathlib
 import hashlib
-import json
 import datetime as dt
-import requests
+import orjson
+import httpx
+import xlsxwriter
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import zipfile
 import gzip, shutil
+import re
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
 
-from arelle import Cntlr, ModelManager
+from lxml import etree
+
+from arelle import Cntlr, FunctionIxt
+from arelle.XmlUtil import collapseWhitespace
 from arelle.ModelXbrl import ModelXbrl
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
@@ -34,38 +48,212 @@ FACT_LOCALNAMES = [
 ]
 
 # On capte aussi des variantes IFRS usuelles + extensions contenant ces mots-clés
-FACT_LOCALNAMES_EXTRA = {
+FACT_LOCALNAMES_EXTRA = frozenset({
     "Revenues", "SalesRevenueNet",
     "RevenueFromContractsWithCustomersExcludingAssessedTax",
     "ProfitLoss", "ProfitLossFromOperatingActivities",
     "OperatingIncomeLoss", "GrossProfit"
-}
+})
 FACT_KEYWORDS = ("revenue", "revenu", "sales", "profit", "loss")
-
-
-def download(url: str) -> pathlib.Path:
-    """Télécharge en mode robuste (ZIP lourds ok)."""
+# mêmes mots-clés en une regex, pour le filtre vectorisé (_wanted_mask)
+FACT_KEYWORDS_RE = "|".join(map(re.escape, FACT_KEYWORDS))
+# version figée pour les tests d'appartenance (partagée par les workers)
+WANTED_LOCALNAMES = frozenset(FACT_LOCALNAMES)
+
+# Colonnes des sorties (Facts), dans l'ordre renvoyé par extract_facts
+FACT_COLUMNS = (
+    "concept_local",
+    "entity_lei",
+    "period_start",
+    "period_end",
+    "value",
+    "unit",
+    "decimals",
+    "source_doc",
+)
+# périodes en timestamps natifs (les dates XBRL n'ont pas de fuseau : timestamps naïfs)
+PERIOD_COLUMNS = ("period_start", "period_end")
+FACT_SCHEMA = pa.schema([
+    (name, pa.timestamp("us") if name in PERIOD_COLUMNS else pa.string())
+    for name in FACT_COLUMNS
+])
+# rendu texte des périodes dans le CSV / l'Excel (identique à l'ancien isoformat())
+PERIOD_TEXT_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# colonnes très répétitives (quelques valeurs distinctes) : encodées en dictionnaire
+# dans la table Arrow -> Parquet dictionnaire, et category côté pandas.read_parquet
+DICTIONARY_COLUMNS = ["concept_local", "entity_lei", "unit", "source_doc"]
+# lignes par feuille Excel, en-tête compris
+EXCEL_MAX_ROWS = 1_048_576
+
+# Cache des facts extraits (data/raw/<sha1>.facts.parquet) : la clé couvre aussi le filtre
+# de concepts ; à incrémenter quand la logique d'extraction change
+FACTS_CACHE_VERSION = 3
+FACTS_CACHE_KEY = orjson.dumps([
+    FACTS_CACHE_VERSION,
+    sorted(WANTED_LOCALNAMES),
+    sorted(FACT_LOCALNAMES_EXTRA),
+    FACT_KEYWORDS,
+])
+
+# Lecture en flux des iXBRL (ESEF = Inline XBRL 1.1)
+IX = "{http://www.xbrl.org/2013/inlineXBRL}"
+XBRLI = "{http://www.xbrl.org/2003/instance}"
+XSI_NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+# éléments ix dont le contenu texte n'est lu qu'à la fermeture : on ne purge rien dedans
+IX_TEXT_HOLDERS = frozenset({IX + "nonNumeric", IX + "continuation", IX + "footnote"})
+# xs:date / xs:dateTime, fuseau (Z ou ±hh:mm) à part : fromisoformat lirait "+01:00" comme une heure
+XBRL_DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2}(?:T[0-9:.]+)?)(Z|[+-]\d{2}:\d{2})?")
+# balises XHTML vides écrites <br/> par Arelle (les autres : <p></p>)
+SELF_CLOSING_TAGS = frozenset({
+    "area", "base", "basefont", "br", "col", "frame", "hr",
+    "img", "input", "isindex", "link", "meta", "param",
+})
+
+# Téléchargements concurrents (I/O pur) : un client HTTP/2 asynchrone, les GET d'un même
+# hôte sont multiplexés sur une seule connexion TLS
+DOWNLOAD_CONNECTIONS = 8
+HTTP_HEADERS = {"User-Agent": "tracecube/0.1"}
+
+# JSON via orjson : datetimes sérialisés nativement, UTC suffixé "Z" comme avant
+JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY
+
+# Manifeste des téléchargements (clé sha1(url)) : ETag / taille pour revalider sans tout retélécharger
+CACHE_MANIFEST = RAW / "_cache_manifest.json"
+
+
+def _load_manifest() -> dict:
+    try:
+        return orjson.loads(CACHE_MANIFEST.read_bytes())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _cache_entry(url: str) -> dict:
+    return _load_manifest().get(hashlib.sha1(url.encode()).hexdigest(), {})
+
+
+def _record_download(url: str, path: pathlib.Path, headers) -> None:
+    """Met à jour l'entrée de l'URL (écriture atomique ; sans await, donc sans course
+    entre téléchargements de la boucle asyncio)."""
+    manifest = _load_manifest()
+    manifest[hashlib.sha1(url.encode()).hexdigest()] = {
+        "url": url,
+        "file": path.name,
+        "etag": headers.get("ETag"),
+        "content_length": headers.get("Content-Length"),
+        "fetched_at_utc": dt.datetime.now(dt.timezone.utc),
+    }
+    tmp = CACHE_MANIFEST.with_suffix(".tmp")
+    tmp.write_bytes(orjson.dumps(manifest, option=JSON_OPTIONS))
+    tmp.replace(CACHE_MANIFEST)
+
+
+def _source_down(err: httpx.HTTPError) -> bool:
+    """Panne côté source (réseau, 5xx, 429) : une copie locale reste utilisable."""
+    if isinstance(err, httpx.HTTPStatusError):
+        status = err.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(err, httpx.TransportError)
+
+
+async def _is_fresh(
+    client: httpx.AsyncClient, url: str, path: pathlib.Path, entry: dict
+) -> bool:
+    """HEAD conditionnel : vrai si la copie locale correspond toujours à la source."""
+    headers = {"If-None-Match": entry["etag"]} if entry.get("etag") else {}
+    r = await client.head(url, timeout=30, headers=headers)
+    if r.status_code == 304:
+        return True
+    if r.status_code >= 500 or r.status_code == 429:
+        r.raise_for_status()
+    if not r.is_success:
+        # HEAD refusé (405/403…) ou autre statut : pas de revalidation possible -> GET
+        return False
+    etag = r.headers.get("ETag")
+    if etag and entry.get("etag"):
+        return etag == entry["etag"]
+    # pas d'ETag comparable : on se rabat sur la taille
+    try:
+        length = int(r.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return False
+    if length != path.stat().st_size:
+        return False
+    if not entry:
+        # copie d'un run antérieur au manifeste : on l'enregistre
+        _record_download(url, path, r.headers)
+    return True
+
+
+async def download(client: httpx.AsyncClient, url: str) -> pathlib.Path:
+    """Télécharge en mode robuste (ZIP lourds ok), revalide la copie locale si elle existe."""
     fn = url.split("/")[-1] or f"file_{hashlib.sha1(url.encode()).hexdigest()}.xbrl"
     path = RAW / fn
-    if path.exists():
-        return path
-    with requests.get(
-        url,
-        timeout=120,
-        allow_redirects=True,
-        stream=True,
-        headers={"User-Agent": "tracecube/0.1"},
-    ) as r:
-        r.raise_for_status()
-        with open(path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
+    replacing = path.exists()
+    if replacing:
+        try:
+            if await _is_fresh(client, url, path, _cache_entry(url)):
+                return path
+        except httpx.HTTPError as err:
+            # source injoignable ou en panne : on garde la copie locale
+            if _source_down(err):
+                return path
+            raise
+
+    part = path.with_name(path.name + ".part")
+    try:
+        async with client.stream("GET", url) as r:
+            r.raise_for_status()
+            with open(part, "wb") as f:
+                async for chunk in r.aiter_bytes(chunk_size=1024 * 1024):
                     f.write(chunk)
+            headers = r.headers
+    except httpx.HTTPError as err:
+        part.unlink(missing_ok=True)
+        if replacing and _source_down(err):
+            return path
+        raise
+    # remplacement seulement une fois le fichier complet
+    part.replace(path)
+    if replacing:
+        # contenu changé : l'ancienne extraction n'est plus valable
+        shutil.rmtree(RAW / (path.stem + "_unzipped"), ignore_errors=True)
+    _record_download(url, path, headers)
     return path
 
+
+async def download_all(urls: list[str]) -> list[pathlib.Path | BaseException]:
+    """Télécharge toutes les URLs en parallèle ; une exception par URL en échec, dans l'ordre."""
+    async with httpx.AsyncClient(
+        http2=True,
+        # toutes les URLs partent d'un coup mais au plus DOWNLOAD_CONNECTIONS connexions :
+        # l'attente d'une connexion libre ne doit pas compter dans le timeout
+        timeout=httpx.Timeout(120, pool=None),
+        follow_redirects=True,
+        headers=HTTP_HEADERS,
+        limits=httpx.Limits(max_connections=DOWNLOAD_CONNECTIONS),
+    ) as client:
+        return await asyncio.gather(
+            *(download(client, u) for u in urls), return_exceptions=True
+        )
+
+def _instance_rank(name: str) -> tuple[int, int]:
+    """Tri des candidats : souvent dans /reports/, puis chemin le plus court."""
+    return (0 if "reports" in pathlib.PurePosixPath(name).parts else 1, len(name))
+
+def _extracted(target: pathlib.Path, info: zipfile.ZipInfo) -> bool:
+    """Vrai si le membre est déjà extrait en entier."""
+    try:
+        return target.stat().st_size == info.file_size
+    except FileNotFoundError:
+        return False
+
 def path_to_instance(p: pathlib.Path) -> pathlib.Path:
     """Si p est un .zip, on extrait et on retourne le premier iXBRL trouvé.
     Supporte *.xhtml, *.html, et leurs variantes *.xhtml.gz / *.html.gz.
+
+    Seuls l'instance retenue et les fichiers de taxonomie du package (.xsd/.xml,
+    utiles au repli Arelle) sont extraits : ni images, ni PDF, ni autres rapports.
     """
     p = pathlib.Path(p)
     if p.suffix.lower() != ".zip":
@@ -75,47 +263,59 @@ def path_to_instance(p: pathlib.Path) -> pathlib.Path:
     outdir.mkdir(parents=True, exist_ok=True)
 
     with zipfile.ZipFile(p, "r") as z:
-        z.extractall(outdir)
-
-    # 1) candidats non compressés (priorité iXBRL)
-    plain = list(outdir.rglob("*.xhtml")) + list(outdir.rglob("*.html"))
-    # 2) candidats .gz (souvent dans /reports/)
-    gz = list(outdir.rglob("*.xhtml.gz")) + list(outdir.rglob("*.html.gz"))
-
-    candidates: list[pathlib.Path] = []
-
-    if plain:
-        candidates = plain
-    elif gz:
-        # on décompresse le premier .gz trouvé à côté, et on l'utilise
-        gz_path = sorted(gz, key=lambda x: (0 if "reports" in x.parts else 1, len(str(x))))[0]
-        target = gz_path.with_suffix("")  # retire l'extension .gz -> .xhtml/.html
-        if not target.exists():
-            with gzip.open(gz_path, "rb") as fin, open(target, "wb") as fout:
+        infos = {i.filename: i for i in z.infolist() if not i.is_dir()}
+        names = list(infos)
+        # 1) candidats non compressés (priorité iXBRL)
+        plain = [n for n in names if n.lower().endswith((".xhtml", ".html"))]
+        # 2) candidats .gz (souvent dans /reports/)
+        gz = [n for n in names if n.lower().endswith((".xhtml.gz", ".html.gz"))]
+        candidates = plain or gz
+        if not candidates:
+            raise FileNotFoundError(f"Aucune instance iXBRL/XBRL (même .gz) dans {p.name}")
+
+        best = min(candidates, key=_instance_rank)
+        support = [n for n in names if n.lower().endswith((".xsd", ".xml"))]
+        # déjà extrait lors d'un run précédent (le dossier est purgé si le zip change) ;
+        # une taille différente = extraction interrompue, on ré-extrait
+        members = [n for n in (best, *support) if not _extracted(outdir / n, infos[n])]
+        if members:
+            z.extractall(outdir, members=members)
+
+    inst = outdir / best
+    if not plain:
+        # on décompresse le .gz à côté, et on l'utilise
+        target = inst.with_suffix("")  # retire l'extension .gz -> .xhtml/.html
+        if best in members or not target.exists():
+            # via .part : une décompression interrompue ne laisse pas de cible tronquée
+            part = target.with_name(target.name + ".part")
+            with gzip.open(inst, "rb") as fin, open(part, "wb") as fout:
                 shutil.copyfileobj(fin, fout)
-        candidates = [target]
-
-    if not candidates:
-        raise FileNotFoundError(f"Aucune instance iXBRL/XBRL (même .gz) dans {p.name}")
+            part.replace(target)
+        inst = target
+    return inst
 
-    # petit tri: souvent dans /reports/
-    candidates.sort(key=lambda x: (0 if "reports" in x.parts else 1, len(str(x))))
-    return candidates[0]
-
-def load_xbrl(path: str) -> ModelXbrl:
-    """Charge l'instance XBRL avec Arelle et log dans data/out/arelle.log."""
+@lru_cache(maxsize=1)
+def _controller() -> Cntlr.Cntlr:
+    """Contrôleur Arelle unique par processus (config, webCache et log initialisés une fois)."""
     log_path = OUT / "arelle.log"
     ctrl = Cntlr.Cntlr(logFileName=str(log_path))
     # important: online pour résoudre les taxos manquantes dans le runner
     ctrl.webCache.workOffline = False
-    mm = ModelManager.initialize(ctrl)
-    return mm.load(path)
+    return ctrl
+
+def load_xbrl(path: str) -> ModelXbrl:
+    """Charge l'instance XBRL avec Arelle et log dans data/out/arelle.log.
 
-def dump_sample_facts(x: ModelXbrl, limit: int = 200) -> None:
+    x.close() libère le modèle chargé ; le contrôleur partagé reste vivant.
+    """
+    return _controller().modelManager.load(path)
+
+def dump_sample_facts(x: ModelXbrl, path: pathlib.Path, limit: int = 200) -> None:
     """Écrit un échantillon des facts (concept qname/local, value…) pour debug."""
     rows = []
     for f in x.facts[:limit]:
-        qn = getattr(f, "concept", None).qname if getattr(f, "concept", None) else None
+        c = getattr(f, "concept", None)
+        qn = c.qname if c is not None else None
         rows.append({
             "concept_qname": str(qn) if qn else None,
             "local": qn.localName if qn else None,
@@ -124,41 +324,62 @@ def dump_sample_facts(x: ModelXbrl, limit: int = 200) -> None:
             "decimals": getattr(f, "decimals", None),
             "is_nil": getattr(f, "isNil", False),
         })
-    pd.DataFrame(rows).to_csv(OUT / "facts_sample.csv", index=False)
+    pd.DataFrame(rows).to_csv(path, index=False)
 
 def _format_unit(fact) -> str | None:
-    """Formate l'unité (ex: ISO4217.EUR)."""
-    if not getattr(fact, "unit", None) or not fact.unit.measures:
+    """Formate l'unité (ex: iso4217:EUR, iso4217:EUR/xbrli:shares)."""
+    unit = getattr(fact, "unit", None)
+    if unit is None or not unit.measures:
         return None
-    num = ["*".join(u) for u in (fact.unit.measures[0] or [])]
-    den = ["*".join(u) for u in (fact.unit.measures[1] or [])]
+    num, den = unit.measures
+    # tuples de QName : hashables, ils servent directement de clé de cache
+    return _unit_label(tuple(num or ()), tuple(den or ()))
+
+
+@lru_cache(maxsize=256)
+def _unit_label(num: tuple, den: tuple) -> str | None:
+    """Assemble numérateur / dénominateur d'une unité (peu de valeurs distinctes par filing)."""
     parts = []
     if num:
-        parts.append(".".join(num))
+        parts.append("*".join(str(m) for m in num))
     if den:
-        parts.append("/" + ".".join(den))
+        parts.append("/" + "*".join(str(m) for m in den))
     return "".join(parts) if parts else None
 
 
-def extract_facts(x: ModelXbrl, wanted_locals: list[str]) -> list[dict]:
-    rows: list[dict] = []
-    for f in x.facts:
+def extract_facts(x: ModelXbrl, wanted_locals: list[str] | frozenset[str]) -> tuple[list, ...]:
+    """Extrait les facts retenus en colonnes (une liste par champ, ordre FACT_COLUMNS)."""
+    concepts: list = []
+    leis: list = []
+    starts: list = []
+    ends: list = []
+    values: list = []
+    units: list = []
+    decimals: list = []
+    sources: list = []
+    source_doc = x.modelDocument.uri
+    # test d'appartenance O(1)
+    wanted = wanted_locals if isinstance(wanted_locals, frozenset) else frozenset(wanted_locals)
+    # filtre une fois par concept présent (index Arelle factsByQname), pas une fois par fact ;
+    # on reste dans l'ordre du document
+    by_qname = x.factsByQname
+    qnames = list(by_qname)
+    mask = _wanted_mask([qn.localName for qn in qnames], wanted)
+    wanted_qnames = [qn for qn, keep in zip(qnames, mask) if keep]
+    facts = sorted(
+        (f for qn in wanted_qnames for f in by_qname.get(qn, ())),
+        key=lambda f: f.objectIndex,
+    )
+    for f in facts:
         c = getattr(f, "concept", None)
-        if not c:
+        # élément lxml : sa valeur de vérité dépend des enfants, pas de son existence
+        if c is None:
             continue
         local = c.qname.localName
 
-        keep = (
-            (local in wanted_locals) or
-            (local in FACT_LOCALNAMES_EXTRA) or
-            any(k in local.lower() for k in FACT_KEYWORDS)
-        )
-        if not keep:
-            continue
-
         ctx = getattr(f, "context", None)
         ent = None
-        if ctx:
+        if ctx is not None:
             try:
                 # certains filings exposent comme tuple (scheme, value)
                 ent = ctx.entityIdentifier[1]
@@ -168,19 +389,395 @@ def extract_facts(x: ModelXbrl, wanted_locals: list[str]) -> list[dict]:
         end = getattr(ctx, "endDatetime", None)
         start = getattr(ctx, "startDatetime", None)
 
-        rows.append(
-            {
-                "concept_local": local,
-                "entity_lei": ent,
-                "period_start": start.isoformat() if start else None,
-                "period_end": end.isoformat() if end else None,
-                "value": f.value,
-                "unit": _format_unit(f),
-                "decimals": getattr(f, "decimals", None),
-                "source_doc": x.modelDocument.uri,
-            }
+        concepts.append(local)
+        leis.append(ent)
+        starts.append(start)
+        ends.append(end)
+        values.append(f.value)
+        units.append(_format_unit(f))
+        decimals.append(getattr(f, "decimals", None))
+        sources.append(source_doc)
+    return concepts, leis, starts, ends, values, units, decimals, sources
+
+
+def _is_wanted(local: str, wanted: frozenset[str]) -> bool:
+    """Filtre des concepts : noms exacts, variantes IFRS, puis mots-clés."""
+    if local in wanted or local in FACT_LOCALNAMES_EXTRA:
+        return True
+    # .lower() seulement si les tests exacts n'ont rien donné
+    ll = local.lower()
+    return any(k in ll for k in FACT_KEYWORDS)
+
+
+@lru_cache(maxsize=8)
+def _exact_names(wanted: frozenset[str]) -> pa.Array:
+    """Noms exacts acceptés (wanted + variantes IFRS), construits une fois par jeu de noms."""
+    return pa.array(sorted(wanted | FACT_LOCALNAMES_EXTRA), type=pa.string())
+
+
+def _wanted_mask(names: list[str], wanted: frozenset[str]) -> list[bool]:
+    """_is_wanted appliqué d'un coup à une liste de noms (kernels pyarrow.compute)."""
+    arr = pa.array(names, type=pa.string())
+    exact = pc.is_in(arr, value_set=_exact_names(wanted))
+    keyword = pc.match_substring_regex(arr, FACT_KEYWORDS_RE, ignore_case=True)
+    return pc.or_(exact, keyword).to_pylist()
+
+
+def _xbrl_datetime(text: str, end_of_day: bool = False) -> dt.datetime:
+    """Date XBRL -> datetime, même convention qu'Arelle (une date de fin = minuit du jour suivant).
+
+    Un fuseau explicite donne un datetime avec tzinfo, comme ModelValue.dateTime.
+    """
+    m = XBRL_DATE_RE.fullmatch(text.strip())
+    if m is None:
+        raise ValueError(f"date XBRL invalide: {text!r}")
+    moment, tz = m.groups()
+    value = dt.datetime.fromisoformat(moment)
+    if tz:
+        value = value.replace(
+            tzinfo=dt.timezone.utc if tz == "Z" else dt.datetime.strptime(tz, "%z").tzinfo
         )
-    return rows
+    if end_of_day and "T" not in moment:
+        value += dt.timedelta(days=1)
+    return value
+
+
+def _read_context(el) -> tuple:
+    """(entité, début, fin) d'un xbrli:context."""
+    ident = el.findtext(f"{XBRLI}entity/{XBRLI}identifier")
+    start = el.findtext(f"{XBRLI}period/{XBRLI}startDate")
+    end = (
+        el.findtext(f"{XBRLI}period/{XBRLI}endDate")
+        or el.findtext(f"{XBRLI}period/{XBRLI}instant")
+    )
+    return (
+        ident.strip() if ident else None,
+        _xbrl_datetime(start) if start else None,
+        _xbrl_datetime(end, end_of_day=True) if end else None,
+    )
+
+
+def _read_unit(el) -> str | None:
+    """Libellé d'un xbrli:unit (mesures triées, comme ModelUnit.measures)."""
+    num = el.findall(f"{XBRLI}divide/{XBRLI}unitNumerator/{XBRLI}measure")
+    if num:
+        den = el.findall(f"{XBRLI}divide/{XBRLI}unitDenominator/{XBRLI}measure")
+    else:
+        num, den = el.findall(f"{XBRLI}measure"), []
+    return _unit_label(
+        tuple(sorted(m.text.strip() for m in num)),
+        tuple(sorted(m.text.strip() for m in den)),
+    )
+
+
+def _ix_text(el) -> str:
+    """Texte d'un élément ix, hors ix:exclude."""
+    parts = [el.text or ""]
+    for child in el:
+        if isinstance(child.tag, str) and child.tag != IX + "exclude":
+            parts.append(_ix_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def _escape_text(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _markup_name(el, name: str) -> str:
+    """Nom préfixé (prefix:local) d'une balise ou d'un attribut, comme Arelle."""
+    qn = etree.QName(name)
+    if qn.namespace is None:
+        return qn.localname
+    if qn.namespace == "http://www.w3.org/XML/1998/namespace":
+        return "xml:" + qn.localname
+    prefix = next((p for p, ns in el.nsmap.items() if ns == qn.namespace and p), None)
+    return f"{prefix}:{qn.localname}" if prefix else qn.localname
+
+
+def _ix_markup(el) -> str:
+    """Contenu d'un élément ix escape="true" : XHTML re-sérialisé comme Arelle, hors ix:exclude.
+
+    Les balises ix imbriquées ne sont pas écrites, seul leur contenu l'est.
+    """
+    parts = [_escape_text(el.text or "")]
+    for child in el:
+        if isinstance(child.tag, str) and child.tag != IX + "exclude":
+            inner = _ix_markup(child)
+            if child.tag.startswith(IX):
+                parts.append(inner)
+            else:
+                name = f"{child.prefix}:" if child.prefix else ""
+                name += etree.QName(child).localname
+                attrs = "".join(
+                    ' {}="{}"'.format(
+                        _markup_name(child, k), v.replace("&", "&amp;").replace('"', "&quot;")
+                    )
+                    for k, v in sorted(child.items())
+                )
+                if inner:
+                    parts.append(f"<{name}{attrs}>{inner}</{name}>")
+                elif etree.QName(child).localname in SELF_CLOSING_TAGS:
+                    parts.append(f"<{name}{attrs}/>")
+                else:
+                    parts.append(f"<{name}{attrs}></{name}>")
+        parts.append(_escape_text(child.tail or ""))
+    return "".join(parts)
+
+
+def _ix_number(el) -> str:
+    """Valeur d'un ix:nonFraction, calculée comme ModelInlineFact.value.
+
+    Transformation ixt d'Arelle, puis scale et sign ; une valeur entière perd ses
+    décimales sauf si le texte transformé contient ".0".
+    """
+    if el.get(XSI_NIL) == "true":
+        return ""
+    v = _ix_text(el)
+    fmt = el.get("format")
+    if fmt:
+        prefix, _, local = fmt.rpartition(":")
+        transform = FunctionIxt.ixtNamespaceFunctions.get(el.nsmap.get(prefix or None), {}).get(local)
+        if transform is None:
+            # transformation personnalisée : on laisse Arelle l'appliquer
+            raise ValueError(f"format ixt non géré: {fmt}")
+        v = transform(collapseWhitespace(v))
+    num = Decimal(v)
+    scale = el.get("scale")
+    if scale:
+        num *= 10 ** Decimal(scale)
+    if el.get("sign") == "-":
+        num *= -1
+    if num.is_infinite():
+        return "-INF" if num < 0 else "INF"
+    if num.is_nan():
+        return "NaN"
+    if num == num.to_integral() and ".0" not in v:
+        num = num.quantize(Decimal(1))
+    return format(num, "f")
+
+
+def fast_extract_facts(path: pathlib.Path, wanted: frozenset[str]) -> tuple[list, ...]:
+    """Extrait les facts retenus d'un iXBRL en un seul passage lxml, sans DTS Arelle.
+
+    Contextes, unités et continuations sont résolus en fin de lecture (ils peuvent
+    suivre les facts). Lève une exception si le document sort du cas simple :
+    l'appelant repasse alors par Arelle.
+
+    Écarts connus avec Arelle :
+    - escape="true" : le XHTML est conservé, mais les href/src relatifs ne sont pas
+      résolus en URI absolues ;
+    - le format ixt d'un ix:nonNumeric (dates en toutes lettres...) n'est pas appliqué :
+      on garde le texte affiché ;
+    - ix:nonFraction entier (type xbrli:integerItemType…) écrit "100.00" : Arelle le
+      ramène à "100", le type du concept n'est pas connu ici ;
+    - ix:fraction et ix:tuple sont ignorés.
+    """
+    contexts: dict[str, tuple] = {}
+    units: dict[str, str | None] = {}
+    # id -> (texte, XHTML re-sérialisé, continuedAt)
+    continuations: dict[str, tuple[str, str, str | None]] = {}
+    # (local, contextRef, unitRef, decimals, value, continuedAt, escape)
+    kept: list[tuple] = []
+    # décision du filtre par nom de concept : un même concept revient sur de nombreux facts
+    keep_by_name: dict[str, bool] = {}
+    n_facts = 0
+    open_text = 0
+
+    for event, el in etree.iterparse(
+        str(path),
+        events=("start", "end"),
+        tag=(IX + "*", XBRLI + "context", XBRLI + "unit"),
+        huge_tree=True,
+    ):
+        tag = el.tag
+        if event == "start":
+            if tag in IX_TEXT_HOLDERS:
+                open_text += 1
+            continue
+        if tag in IX_TEXT_HOLDERS:
+            open_text -= 1
+
+        if tag == XBRLI + "context":
+            contexts[el.get("id")] = _read_context(el)
+        elif tag == XBRLI + "unit":
+            units[el.get("id")] = _read_unit(el)
+        elif tag == IX + "continuation":
+            continuations[el.get("id")] = (_ix_text(el), _ix_markup(el), el.get("continuedAt"))
+        elif tag == IX + "nonFraction" or tag == IX + "nonNumeric":
+            n_facts += 1
+            local = (el.get("name") or "").rpartition(":")[2]
+            keep = keep_by_name.get(local)
+            if keep is None:
+                keep = keep_by_name[local] = _is_wanted(local, wanted)
+            if keep:
+                escape = el.get("escape") in ("true", "1")
+                if tag == IX + "nonFraction":
+                    value = _ix_number(el)
+                elif el.get(XSI_NIL) == "true":
+                    value = ""
+                else:
+                    value = _ix_markup(el) if escape else _ix_text(el)
+                kept.append((
+                    local,
+                    el.get("contextRef"),
+                    el.get("unitRef"),
+                    el.get("decimals"),
+                    value,
+                    el.get("continuedAt"),
+                    escape,
+                ))
+
+        # mémoire à plat : on purge ce qui est lu, sauf à l'intérieur d'un texte ix ouvert
+        if open_text == 0:
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+
+    if not n_facts:
+        raise ValueError(f"aucun fact Inline XBRL 1.1 dans {path.name}")
+
+    columns: tuple[list, ...] = tuple([] for _ in FACT_COLUMNS)
+    concepts, leis, starts, ends, values, units_col, decimals, sources = columns
+    source_doc = str(path)
+    for local, ctx_ref, unit_ref, dec, value, cont, escape in kept:
+        seen = set()
+        while cont and cont not in seen:
+            seen.add(cont)
+            text, markup, cont = continuations[cont]
+            value += markup if escape else text
+        ent, start, end = contexts[ctx_ref]
+
+        concepts.append(local)
+        leis.append(ent)
+        starts.append(start)
+        ends.append(end)
+        values.append(value)
+        units_col.append(units[unit_ref] if unit_ref else None)
+        decimals.append(dec)
+        sources.append(source_doc)
+    return columns
+
+
+def extract_instance(inst: pathlib.Path) -> tuple[tuple[list, ...], bool]:
+    """Facts d'une instance : lecture en flux pour l'iXBRL, Arelle sinon (ou en repli).
+
+    Renvoie (colonnes, cacheable). Un chargement Arelle en erreur (taxonomie injoignable,
+    schéma invalide…) ou avec des facts sans concept résolu n'est pas cacheable : ses
+    facts manquants ne doivent pas être servis aux runs suivants.
+    """
+    if inst.suffix.lower() in (".xhtml", ".html"):
+        try:
+            columns = fast_extract_facts(inst, WANTED_LOCALNAMES)
+            print(f"[{inst.name}] facts retenus (flux): {len(columns[0])}")
+            return columns, True
+        except Exception as e:
+            print(f"[{inst.name}] lecture en flux impossible ({e}) -> Arelle")
+
+    x = load_xbrl(str(inst))
+    try:
+        # un fichier par instance : les workers tournent en parallèle
+        dump_sample_facts(x, OUT / f"facts_sample_{inst.stem}.csv", limit=300)
+        print(f"[{inst.name}] facts: {len(getattr(x, 'facts', []))}")
+        columns = extract_facts(x, WANTED_LOCALNAMES)
+        cacheable = not x.errors and all(
+            getattr(f, "concept", None) is not None for f in x.facts
+        )
+        if not cacheable:
+            print(f"[{inst.name}] chargement Arelle incomplet ({x.errors[:3]}), facts non mis en cache")
+        return columns, cacheable
+    finally:
+        x.close()
+
+
+def _to_batch(columns: tuple[list, ...]) -> pa.RecordBatch:
+    """Colonnes (ordre FACT_COLUMNS) -> RecordBatch Arrow au schéma FACT_SCHEMA."""
+    return pa.RecordBatch.from_pydict(dict(zip(FACT_COLUMNS, columns)), schema=FACT_SCHEMA)
+
+
+def _facts_cache_path(inst: pathlib.Path) -> pathlib.Path:
+    """Cache des facts extraits : clé = contenu de l'instance + paramètres d'extraction."""
+    h = hashlib.sha1(FACTS_CACHE_KEY)
+    with open(inst, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return RAW / f"{h.hexdigest()}.facts.parquet"
+
+
+def _process_one(path_str: str) -> tuple[str, list[pa.RecordBatch]]:
+    """Tâche d'un worker : fichier téléchargé -> (nom de l'instance, batches de facts)."""
+    inst = path_to_instance(pathlib.Path(path_str))
+    print(f"[unzip] instance: {inst}")
+    cache = _facts_cache_path(inst)
+    if cache.exists():
+        print(f"[{inst.name}] facts en cache: {cache.name}")
+        return inst.name, pq.read_table(cache, schema=FACT_SCHEMA).to_batches()
+
+    columns, cacheable = extract_instance(inst)
+    batch = _to_batch(columns)
+    if cacheable:
+        tmp = cache.with_name(cache.name + ".tmp")
+        pq.write_table(pa.Table.from_batches([batch]), tmp, compression="zstd")
+        tmp.replace(cache)
+    return inst.name, [batch]
+
+
+def _error_batch(url: str, err: Exception) -> pa.RecordBatch:
+    """Batch d'une ligne __ERROR__ (les champs non renseignés restent à None)."""
+    row = {"concept_local": "__ERROR__", "source_doc": url, "value": str(err)}
+    return _to_batch(tuple([row.get(name)] for name in FACT_COLUMNS))
+
+
+def _dictionary_encode(table: pa.Table) -> pa.Table:
+    """Encode DICTIONARY_COLUMNS en dictionnaire (équivalent Arrow de pd.Categorical)."""
+    for name in DICTIONARY_COLUMNS:
+        i = table.schema.get_field_index(name)
+        table = table.set_column(i, name, pc.dictionary_encode(table[name]))
+    return table
+
+
+def _with_text_periods(table: pa.Table) -> pa.Table:
+    """Copie de la table avec les périodes formatées en texte ISO (en C, via pyarrow.compute)."""
+    for name in PERIOD_COLUMNS:
+        i = table.schema.get_field_index(name)
+        # précision seconde : sinon %S sort les microsecondes
+        col = pc.cast(table[name], pa.timestamp("s"), safe=False)
+        table = table.set_column(i, name, pc.strftime(col, format=PERIOD_TEXT_FORMAT))
+    return table
+
+
+def write_excel(path: pathlib.Path, table: pa.Table, sources: list[tuple[str, str]]) -> None:
+    """Classeur Facts + Sources écrit ligne à ligne (xlsxwriter constant_memory : mémoire plate).
+
+    En constant_memory on ne peut écrire que dans l'ordre des lignes, d'où l'écriture
+    directe plutôt que df.to_excel (qui remplit colonne par colonne). Au-delà de
+    EXCEL_MAX_ROWS lignes, les facts continuent sur Facts_2, Facts_3… :
+    xlsxwriter ignorerait sinon les lignes en trop sans erreur.
+    """
+    wb = xlsxwriter.Workbook(
+        str(path),
+        {"constant_memory": True, "strings_to_formulas": False, "strings_to_urls": False},
+    )
+    try:
+        ws = wb.add_worksheet("Facts")
+        ws.write_row(0, 0, table.column_names)
+        r, sheets = 1, 1
+        for batch in table.to_batches():
+            for row in zip(*(col.to_pylist() for col in batch.columns)):
+                if r == EXCEL_MAX_ROWS:
+                    sheets += 1
+                    ws = wb.add_worksheet(f"Facts_{sheets}")
+                    ws.write_row(0, 0, table.column_names)
+                    r = 1
+                ws.write_row(r, 0, row)
+                r += 1
+
+        ws = wb.add_worksheet("Sources")
+        ws.write_row(0, 0, ("url", "saved_as"))
+        for r, row in enumerate(sources, start=1):
+            ws.write_row(r, 0, row)
+    finally:
+        wb.close()
 
 
 def main() -> None:
@@ -191,69 +788,68 @@ def main() -> None:
         if u.strip() and not u.strip().startswith("#")
     ]
 
-    all_rows: list[dict] = []
+    # un RecordBatch Arrow par filing (ou par erreur), assemblés une seule fois à la fin
+    batches: list[pa.RecordBatch] = []
     downloaded: list[tuple[str, str]] = []
 
-    for u in urls:
-        try:
-            p = download(u)
-            inst = path_to_instance(p)
-            downloaded.append((u, inst.name)) 
-            x = load_xbrl(str(inst)) 
-            dump_sample_facts(x, limit=300)
-            print(f"[{inst.name}] facts: {len(getattr(x, 'facts', []))}")
-            print(f"[unzip] instance: {inst}")
-            all_rows.extend(extract_facts(x, FACT_LOCALNAMES))
-            x.close()
-        except Exception as e:
-            all_rows.append(
-                {"concept_local": "__ERROR__", "source_doc": u, "value": str(e)}
-            )
-
-    df = pd.DataFrame(all_rows)
-
-    ts = dt.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    # 1) téléchargements en parallèle (réseau), erreurs conservées par URL,
+    #    dans l'ordre de sources_urls.txt
+    fetched: list[tuple[str, pathlib.Path]] = []
+    for u, res in zip(urls, asyncio.run(download_all(urls))):
+        if isinstance(res, BaseException):
+            batches.append(_error_batch(u, res))
+        else:
+            fetched.append((u, res))
+
+    # 2) extraction en parallèle (CPU) : une filing par processus, résultats dans l'ordre
+    workers = max(1, min(len(fetched), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_controller) as ex:
+        jobs = [(u, ex.submit(_process_one, str(p))) for u, p in fetched]
+        for u, fut in jobs:
+            try:
+                inst_name, inst_batches = fut.result()
+            except Exception as e:
+                batches.append(_error_batch(u, e))
+                continue
+            downloaded.append((u, inst_name))
+            batches.extend(inst_batches)
+
+    # une seule table Arrow (schéma imposé : colonnes présentes même si aucun fact),
+    # partagée par les trois sorties ; CSV/Excel gardent des périodes texte
+    table = _dictionary_encode(pa.Table.from_batches(batches, schema=FACT_SCHEMA))
+    text_table = _with_text_periods(table)
+
+    now = dt.datetime.now(dt.timezone.utc)
+    ts = now.strftime("%Y%m%d-%H%M%S")
     excel_name, csv_name, pq_name = (
         "CarbonTrace_latest.xlsx",
         "facts_latest.csv",
         "facts_latest.parquet",
     )
 
-    # 💡 Écrire les fichiers même si df est vide (headers), pour qu’ils apparaissent dans R2
-    (OUT / csv_name).write_text("" if df.empty else df.to_csv(index=False))
-
-    if df.empty:
-        # parquet/Excel ont besoin d’un df : on crée un DF vide avec colonnes attendues
-        df = pd.DataFrame(
-            columns=[
-                "concept_local",
-                "entity_lei",
-                "period_start",
-                "period_end",
-                "value",
-                "unit",
-                "decimals",
-                "source_doc",
-            ]
-        )
+    # 💡 Écrire les fichiers même si la table est vide, pour qu’ils apparaissent dans R2
+    if table.num_rows == 0:
+        (OUT / csv_name).write_text("")
+    else:
+        # writer CSV Arrow (C++), en flux depuis les buffers de la table
+        pacsv.write_csv(text_table, OUT / csv_name)
 
-    # Parquet + Excel
-    df.to_parquet(OUT / pq_name, index=False)
-    with pd.ExcelWriter(OUT / excel_name) as w:
-        df.to_excel(w, index=False, sheet_name="Facts")
-        pd.DataFrame(downloaded, columns=["url", "saved_as"]).to_excel(
-            w, index=False, sheet_name="Sources"
-        )
+    pq.write_table(
+        table, OUT / pq_name, compression="zstd", use_dictionary=DICTIONARY_COLUMNS
+    )
+
+    # Excel (produit téléchargé depuis le site)
+    write_excel(OUT / excel_name, text_table, downloaded)
 
     manifest = {
         "version": ts,
-        "generated_at_utc": dt.datetime.utcnow().isoformat() + "Z",
-        "rows": int(len(df)),
-        "columns": list(df.columns),
+        "generated_at_utc": now,
+        "rows": table.num_rows,
+        "columns": table.column_names,
         "files": {"excel": excel_name, "csv": csv_name, "parquet": pq_name},
         "notes": "Finance (Revenue/OperatingProfitLoss); ESRS Scope1/2 prêts dès disponibilité.",
     }
-    (OUT / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    (OUT / "manifest.json").write_bytes(orjson.dumps(manifest, option=JSON_OPTIONS))
 
 
 if __name__ == "__main__":
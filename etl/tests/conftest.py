@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# run_etl est un script (etl/run_etl.py), pas un package installé
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
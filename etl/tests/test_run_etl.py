@@ -0,0 +1,237 @@
+import asyncio
+import zipfile
+
+import httpx
+import pyarrow as pa
+import pytest
+
+import run_etl
+
+SCHEMA = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+    xmlns:xbrli="http://www.xbrl.org/2003/instance"
+    targetNamespace="http://example.com/t" elementFormDefault="qualified">
+  <xs:import namespace="http://www.xbrl.org/2003/instance"
+      schemaLocation="http://www.xbrl.org/2003/xbrl-instance-2003-12-31.xsd"/>
+  <xs:element name="Revenue" id="t_Revenue" type="xbrli:monetaryItemType"
+      substitutionGroup="xbrli:item" xbrli:periodType="duration" nillable="true"/>
+</xs:schema>
+"""
+
+INSTANCE = """<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+    xmlns:link="http://www.xbrl.org/2003/linkbase" xmlns:xlink="http://www.w3.org/1999/xlink"
+    xmlns:t="http://example.com/t" xmlns:iso4217="http://www.xbrl.org/2003/iso4217">
+  <link:schemaRef xlink:type="simple" xlink:href="{schema}"/>
+  <xbrli:context id="c1">
+    <xbrli:entity><xbrli:identifier scheme="http://standards.iso.org/iso/17442">LEI1</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2024-01-01</xbrli:startDate><xbrli:endDate>2024-12-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:unit id="EUR"><xbrli:measure>iso4217:EUR</xbrli:measure></xbrli:unit>
+  <t:Revenue contextRef="c1" unitRef="EUR" decimals="0">1000</t:Revenue>
+</xbrli:xbrl>
+"""
+
+
+@pytest.fixture
+def raw_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_etl, "RAW", tmp_path)
+    monkeypatch.setattr(run_etl, "OUT", tmp_path)
+    # pas de réseau dans les tests : taxonomies de base depuis le cache Arelle
+    monkeypatch.setattr(run_etl._controller().webCache, "workOffline", True)
+    return tmp_path
+
+
+def _instance(raw_dir, schema: str):
+    (raw_dir / "t.xsd").write_text(SCHEMA)
+    inst = raw_dir / "i.xbrl"
+    inst.write_text(INSTANCE.format(schema=schema))
+    return inst
+
+
+def test_arelle_results_are_cached(raw_dir):
+    inst = _instance(raw_dir, "t.xsd")
+    _, batches = run_etl._process_one(str(inst))
+    assert sum(b.num_rows for b in batches) == 1
+    assert list(raw_dir.glob("*.facts.parquet"))
+
+
+def test_failed_arelle_load_is_not_cached(raw_dir):
+    # schéma introuvable : concepts non résolus, Arelle journalise une erreur
+    inst = _instance(raw_dir, "missing.xsd")
+    _, batches = run_etl._process_one(str(inst))
+    assert sum(b.num_rows for b in batches) == 0
+    assert not list(raw_dir.glob("*.facts.parquet"))
+
+
+def test_truncated_zip_member_is_extracted_again(raw_dir):
+    archive = raw_dir / "filing.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("filing/reports/report.xhtml", "<html>complete</html>")
+        z.writestr("filing/reports/logo.png", b"\x89PNG")
+    inst = run_etl.path_to_instance(archive)
+    assert not (inst.parent / "logo.png").exists()
+
+    # extraction interrompue lors d'un run précédent
+    inst.write_text("<html>")
+    assert run_etl.path_to_instance(archive).read_text() == "<html>complete</html>"
+
+
+def _download_with(handler, url="https://example.com/filing.zip"):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await run_etl.download(client, url)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "head",
+    [
+        {"status_code": 405},
+        {"status_code": 200, "headers": {"Content-Length": "n/a"}},
+    ],
+)
+def test_download_refetches_when_head_cannot_revalidate(raw_dir, head):
+    (raw_dir / "filing.zip").write_bytes(b"old")
+    methods = []
+
+    def handler(request):
+        methods.append(request.method)
+        if request.method == "HEAD":
+            return httpx.Response(**head)
+        return httpx.Response(200, content=b"new content")
+
+    assert _download_with(handler).read_bytes() == b"new content"
+    assert methods == ["HEAD", "GET"]
+
+
+@pytest.mark.parametrize(
+    "head_status, get_status",
+    [
+        (None, None),  # réseau coupé
+        (503, 503),
+        (429, 429),
+        (405, 503),  # HEAD refusé, GET en panne
+    ],
+)
+def test_download_keeps_local_copy_when_unreachable(raw_dir, head_status, get_status):
+    (raw_dir / "filing.zip").write_bytes(b"old")
+
+    def handler(request):
+        status = head_status if request.method == "HEAD" else get_status
+        if status is None:
+            raise httpx.ConnectError("unreachable", request=request)
+        return httpx.Response(status)
+
+    assert _download_with(handler).read_bytes() == b"old"
+    assert not (raw_dir / "filing.zip.part").exists()
+
+
+INLINE = """<html xmlns="http://www.w3.org/1999/xhtml" xmlns:ix="http://www.xbrl.org/2013/inlineXBRL"
+    xmlns:xbrli="http://www.xbrl.org/2003/instance" xmlns:link="http://www.xbrl.org/2003/linkbase"
+    xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:t="http://example.com/t"
+    xmlns:iso4217="http://www.xbrl.org/2003/iso4217"
+    xmlns:ixt4="http://www.xbrl.org/inlineXBRL/transformation/2020-02-12">
+<head><title>t</title></head>
+<body>
+  <div style="display:none"><ix:header>
+    <ix:references><link:schemaRef xlink:type="simple" xlink:href="t.xsd"/></ix:references>
+    <ix:resources>
+      <xbrli:context id="c1">
+        <xbrli:entity><xbrli:identifier scheme="http://standards.iso.org/iso/17442">LEI1</xbrli:identifier></xbrli:entity>
+        <xbrli:period><xbrli:startDate>{start}</xbrli:startDate><xbrli:endDate>{end}</xbrli:endDate></xbrli:period>
+      </xbrli:context>
+      <xbrli:unit id="EUR"><xbrli:measure>iso4217:EUR</xbrli:measure></xbrli:unit>
+    </ix:resources>
+  </ix:header></div>
+  {body}
+</body>
+</html>
+"""
+
+
+def _fast_and_arelle(raw_dir, body, start="2024-01-01", end="2024-12-31"):
+    """Colonnes Arrow du même iXBRL par la lecture en flux puis par Arelle."""
+    (raw_dir / "t.xsd").write_text(SCHEMA.replace(
+        "</xs:schema>",
+        '  <xs:element name="ProfitNote" id="t_ProfitNote" type="xbrli:stringItemType"\n'
+        '      substitutionGroup="xbrli:item" xbrli:periodType="duration"/>\n</xs:schema>',
+    ))
+    inst = raw_dir / "report.xhtml"
+    inst.write_text(INLINE.format(start=start, end=end, body=body))
+
+    fast = run_etl._to_batch(run_etl.fast_extract_facts(inst, run_etl.WANTED_LOCALNAMES))
+    x = run_etl.load_xbrl(str(inst))
+    try:
+        assert not x.errors
+        arelle = run_etl._to_batch(run_etl.extract_facts(x, run_etl.WANTED_LOCALNAMES))
+    finally:
+        x.close()
+    return fast, arelle
+
+
+def test_escaped_non_numeric_keeps_markup_like_arelle(raw_dir):
+    fast, arelle = _fast_and_arelle(raw_dir, """
+  <ix:nonNumeric name="t:ProfitNote" contextRef="c1" escape="true" continuedAt="k1">
+    <p class="b" id="p1">Profit &amp; <b>loss</b><ix:exclude>page 3</ix:exclude><br/></p><span></span>
+  </ix:nonNumeric>
+  <ix:continuation id="k1"><p>suite &lt;2024&gt;</p></ix:continuation>""")
+    values = fast.column("value").to_pylist()
+    assert values == arelle.column("value").to_pylist()
+    assert "<b>loss</b>" in values[0] and "page 3" not in values[0]
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        ("2024-01-01", "2024-12-31"),
+        ("2024-01-01+01:00", "2024-12-31+01:00"),
+        ("2024-01-01Z", "2024-12-31Z"),
+        ("2024-01-01T00:00:00-05:00", "2024-12-31T23:59:59-05:00"),
+    ],
+)
+def test_periods_match_arelle(raw_dir, start, end):
+    body = '<ix:nonFraction name="t:Revenue" contextRef="c1" unitRef="EUR" decimals="0">1</ix:nonFraction>'
+    fast, arelle = _fast_and_arelle(raw_dir, body, start, end)
+    for name in run_etl.PERIOD_COLUMNS:
+        assert fast.column(name).to_pylist() == arelle.column(name).to_pylist()
+
+
+NON_FRACTIONS = [
+    # (texte, format, scale, sign)
+    ("1.234,50", "ixt4:num-comma-decimal", "-2", None),
+    ("1,234.00", "ixt4:num-dot-decimal", "3", None),
+    ("1,234", "ixt4:num-dot-decimal", "6", "-"),
+    ("0,0", "ixt4:num-comma-decimal", None, "-"),
+    ("-", "ixt4:fixed-zero", None, "-"),
+    ("100", None, "-2", None),
+    ("0.00", None, None, None),
+]
+
+
+def test_non_fraction_values_match_arelle(raw_dir):
+    body = "\n".join(
+        '<ix:nonFraction name="t:Revenue" contextRef="c1" unitRef="EUR" decimals="0"'
+        + "".join(f' {k}="{v}"' for k, v in (("format", fmt), ("scale", scale), ("sign", sign)) if v)
+        + f">{text}</ix:nonFraction>"
+        for text, fmt, scale, sign in NON_FRACTIONS
+    )
+    fast, arelle = _fast_and_arelle(raw_dir, body)
+    assert fast.column("value").to_pylist() == arelle.column("value").to_pylist()
+
+
+def test_excel_spills_facts_over_extra_sheets(tmp_path, monkeypatch):
+    openpyxl = pytest.importorskip("openpyxl")
+
+    monkeypatch.setattr(run_etl, "EXCEL_MAX_ROWS", 3)
+    table = pa.table({"concept_local": [f"c{i}" for i in range(5)]})
+    path = tmp_path / "facts.xlsx"
+    run_etl.write_excel(path, table, [])
+
+    wb = openpyxl.load_workbook(path, read_only=True)
+    assert wb.sheetnames == ["Facts", "Facts_2", "Facts_3", "Sources"]
+    rows = [r for name in wb.sheetnames[:3] for r in wb[name].iter_rows(values_only=True)]
+    assert rows == [
+        ("concept_local",), ("c0",), ("c1",),
+        ("concept_local",), ("c2",), ("c3",),
+        ("concept_local",), ("c4",),
+    ]